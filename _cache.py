@@ -0,0 +1,107 @@
+# encoding: utf-8
+r"""
+
+Directory cache for repeated dircomp runs.
+
+# Overview
+
+Stores, per compared root, the listing of every directory (the names of its
+files and its subdirectories) together with the directory's modification
+time. On the next run, any directory whose mtime is unchanged is not listed
+again; its files are still stat'ed, so sizes and times are always current.
+
+A directory's mtime changes whenever entries are added, removed or renamed,
+which is exactly when its listing changes.
+
+Many filesystems store coarse timestamps (FAT/exFAT 2 s, HFS+ and some NFS
+servers 1 s), so a directory can change again right after it was listed
+while keeping the same mtime. Like git's racy-clean check, a listing is only
+trusted if the directory's mtime is more than RACY_NS older than the start
+of the run; newer listings are saved with UNTRUSTED_MTIME, which never
+matches, so their directory is listed again on the next run.
+
+The cache is a SQLite database. Roots and directory paths are stored as
+bytes, so paths that are not valid UTF-8 work too; listings are stored as
+JSON.
+
+"""
+
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+# How much older than the start of a run a directory's mtime has to be for
+# its listing to be trusted, and the mtime stored when it is not
+RACY_NS         = 2 * 10**9
+UNTRUSTED_MTIME = -1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    root       BLOB    NOT NULL,
+    path       BLOB    NOT NULL,
+    mtime_ns   INTEGER NOT NULL,
+    names      TEXT    NOT NULL,
+    child_dirs TEXT    NOT NULL,
+    PRIMARY KEY (root, path)
+)
+"""
+
+
+def root_key(root):
+    """
+    Helper function to turn a root into its key, the same from any directory
+    """
+    return os.fsencode(os.path.abspath(root))
+
+
+def load(db_path, root):
+    """
+    Helper function to read the cached directories of one root
+
+    Returns a dictionary mapping each directory path below the root to the
+    tuple (mtime_ns, names_json, child_dirs_json); see decode.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.execute(SCHEMA)
+        rows = conn.execute(
+            "SELECT path, mtime_ns, names, child_dirs FROM listings WHERE root = ?",
+            (root_key(root),),
+        )
+        return {os.fsdecode(path): (mtime_ns, names, child_dirs) for path, mtime_ns, names, child_dirs in rows}
+
+
+def encode(mtime_ns, names, child_dirs, scan_start):
+    """
+    Helper function to turn a directory listing into a cache entry
+
+    names are the directory's files and child_dirs its subdirectories, both
+    without the directory's path. scan_start is time.time_ns() at the start
+    of the run; a directory modified since RACY_NS before it is not trusted.
+    """
+    if mtime_ns > scan_start - RACY_NS:
+        mtime_ns = UNTRUSTED_MTIME
+    return mtime_ns, json.dumps(names), json.dumps(child_dirs)
+
+
+def decode(entry):
+    """
+    Helper function to turn a cache entry back into (names, child_dirs)
+    """
+    return json.loads(entry[1]), json.loads(entry[2])
+
+
+def save(db_path, root, entries):
+    """
+    Helper function to replace the cached directories of one root
+
+    Directories that were not seen in this run are dropped.
+    """
+    key = root_key(root)
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.execute(SCHEMA)
+        conn.execute("DELETE FROM listings WHERE root = ?", (key,))
+        conn.executemany(
+            "INSERT INTO listings VALUES (?, ?, ?, ?, ?)",
+            ((key, os.fsencode(path), *entry) for path, entry in entries.items()),
+        )
@@ -0,0 +1,157 @@
+# encoding: utf-8
+r"""
+
+Minimal ctypes wrapper around the Linux statx(2) system call.
+
+# Overview
+
+statx lets us ask the kernel for only the fields we need and, with
+AT_STATX_DONT_SYNC, to return whatever metadata it already has cached
+instead of revalidating it with the filesystem. That is all dircomp needs.
+
+The module probes for statx once at import time and records the result in
+_HAS_STATX. Callers are expected to fall back to os.stat / DirEntry.stat()
+when it is False (non-Linux, unknown architecture, kernel < 4.11). C
+libraries without a statx() wrapper are handled through syscall(2).
+
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import platform
+import sys
+
+#
+# Constants from <fcntl.h> and <linux/stat.h>
+#
+AT_FDCWD           = -100
+AT_STATX_DONT_SYNC = 0x4000
+
+STATX_ATIME = 0x20
+STATX_MTIME = 0x40
+STATX_CTIME = 0x80
+STATX_SIZE  = 0x200
+
+# statx system call numbers, for C libraries without a statx() wrapper
+# (glibc before 2.28)
+SYS_STATX = {
+    "x86_64":  332,
+    "i386":    383,
+    "i686":    383,
+    "aarch64": 291,
+    "armv7l":  397,
+    "ppc64le": 383,
+    "riscv64": 291,
+    "s390x":   379,
+}
+
+# The statx field to request for each dircomp attribute
+MASKS = {
+    "size":  STATX_SIZE,
+    "ctime": STATX_CTIME,
+    "mtime": STATX_MTIME,
+    "atime": STATX_ATIME,
+}
+
+
+class StatxTimestamp(ctypes.Structure):
+    _fields_ = [
+        ("tv_sec",     ctypes.c_int64),
+        ("tv_nsec",    ctypes.c_uint32),
+        ("__reserved", ctypes.c_int32),
+    ]
+
+
+class Statx(ctypes.Structure):
+    """
+    struct statx, with st_* properties mirroring os.stat_result
+    """
+    _fields_ = [
+        ("stx_mask",            ctypes.c_uint32),
+        ("stx_blksize",         ctypes.c_uint32),
+        ("stx_attributes",      ctypes.c_uint64),
+        ("stx_nlink",           ctypes.c_uint32),
+        ("stx_uid",             ctypes.c_uint32),
+        ("stx_gid",             ctypes.c_uint32),
+        ("stx_mode",            ctypes.c_uint16),
+        ("__spare0",            ctypes.c_uint16),
+        ("stx_ino",             ctypes.c_uint64),
+        ("stx_size",            ctypes.c_uint64),
+        ("stx_blocks",          ctypes.c_uint64),
+        ("stx_attributes_mask", ctypes.c_uint64),
+        ("stx_atime",           StatxTimestamp),
+        ("stx_btime",           StatxTimestamp),
+        ("stx_ctime",           StatxTimestamp),
+        ("stx_mtime",           StatxTimestamp),
+        ("stx_rdev_major",      ctypes.c_uint32),
+        ("stx_rdev_minor",      ctypes.c_uint32),
+        ("stx_dev_major",       ctypes.c_uint32),
+        ("stx_dev_minor",       ctypes.c_uint32),
+        ("__spare2",            ctypes.c_uint64 * 14),
+    ]
+
+    @property
+    def st_size(self):
+        return self.stx_size
+
+    @property
+    def st_atime_ns(self):
+        return self.stx_atime.tv_sec * 1000000000 + self.stx_atime.tv_nsec
+
+    @property
+    def st_ctime_ns(self):
+        return self.stx_ctime.tv_sec * 1000000000 + self.stx_ctime.tv_nsec
+
+    @property
+    def st_mtime_ns(self):
+        return self.stx_mtime.tv_sec * 1000000000 + self.stx_mtime.tv_nsec
+
+
+def _load_statx():
+    """
+    Helper function to look up statx in the C library, or None
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if hasattr(libc, "statx"):
+        func = libc.statx
+        func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_uint, ctypes.POINTER(Statx)]
+        func.restype  = ctypes.c_int
+    else:
+        # no wrapper in the C library; go through syscall(2) instead
+        number = SYS_STATX.get(platform.machine())
+        if number is None:
+            return None
+        syscall = libc.syscall
+        syscall.restype = ctypes.c_long
+
+        def func(dir_fd, path, flags, mask, buf):
+            return syscall(ctypes.c_long(number), ctypes.c_int(dir_fd), ctypes.c_char_p(path),
+                           ctypes.c_int(flags), ctypes.c_uint(mask), buf)
+    # glibc may export statx while the kernel lacks it; probe once
+    if func(AT_FDCWD, b"/", AT_STATX_DONT_SYNC, STATX_SIZE, ctypes.byref(Statx())) != 0:
+        if ctypes.get_errno() in (errno.ENOSYS, errno.EPERM):
+            return None
+    return func
+
+
+_statx     = _load_statx()
+_HAS_STATX = _statx is not None
+
+
+def statx(path, mask, dir_fd=AT_FDCWD):
+    """
+    Helper function to call statx on a path, following symlinks like os.stat
+    """
+    buf = Statx()
+    flags = AT_STATX_DONT_SYNC
+    if _statx(dir_fd, os.fsencode(path), flags, mask, ctypes.byref(buf)) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+    return buf
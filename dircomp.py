@@ -20,14 +20,47 @@ $ dircomp.py size /home/user1/Downloads /home/user2/Downloads
 
 This will compare both directory tries based on their files' sizes.
 
+# Cache
+
+When comparing the same trees repeatedly, pass --cache with a file name:
+
+$ dircomp.py size --cache ~/.dircomp.db /home/user1/Downloads /home/user2/Downloads
+
+Directories whose modification time has not changed since the last run are
+then not listed again. Their files are still stat'ed, so files rewritten in
+place are compared with their current size and times.
+Directories changed within two seconds of a run are listed again on the next
+run, since coarse filesystem timestamps could hide a later change.
+
+# Compiled Scanner
+
+Optionally, build the Cython directory scanner next to the script:
+
+$ python setup.py build_ext --inplace
+
+If it is not available, the pure-Python scanner is used.
+
+On Linux, files can be stat'ed through statx(2) instead, which only asks the
+filesystem for the compared field. This is slower on local disks, so it is
+off unless DIRCOMP_STATX=1 is set in the environment.
+
 """
 
 import os # used to interact with the file system
 import sys # used to debug the script
-import timeit # to time options
+import time # to time options and convert file time stamps
 import shutil
-from datetime import datetime # used to convert file time stamps
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED # used to scan directories in parallel
+
+import _statx # statx(2) wrapper, Linux only
+import _cache # directory cache for repeated runs
+try:
+    import _walk # optional compiled scanner, see setup.py
+except ImportError:
+    _walk = None
 
 #
 # More Beautiful Tracebacks and Pretty Printing
@@ -44,11 +77,19 @@ pretty.install()
 traceback.install()
 
 #
-# A global variable to get the count of the total number of files
-# We hold it global because of the timeit.timeit() function
+# Number of threads scanning directories. The scans are bound by system calls,
+# so this is more than the number of CPUs; each open directory holds one file
+# descriptor, so it also caps the descriptors in use.
+#
+scan_workers = min(32, (os.cpu_count() or 1) * 4)
+
+#
+# Whether to stat files through the statx(2) wrapper instead of
+# DirEntry.stat(). Going through ctypes costs more per call than it saves on
+# local filesystems, so it is only used when DIRCOMP_STATX=1 is set, e.g. for
+# network filesystems where AT_STATX_DONT_SYNC avoids a round trip.
 #
-total_files = 0
-differences = 0
+use_statx = _statx._HAS_STATX and os.environ.get("DIRCOMP_STATX") == "1"
 
 
 #
@@ -81,9 +122,12 @@ app = typer.Typer(
 def size (
     files: Optional[List[str]] = typer.Argument(None, help="The files to process"),
     diff:  bool = typer.Option(False, "--diff", "-d", help="Whether to show a diff command"),
+    merge: bool = typer.Option(False, "--merge", "-m", help="Whether to walk both trees together"),
+    cache: Optional[str] = typer.Option(None, "--cache", "-c", help="Cache file to skip listing unchanged directories on later runs"),
+    plain: bool = typer.Option(False, "--no-rich", help="Whether to print plain tab separated lines instead of a table"),
 ):
     # call the compare_directories function to compare the two directories based on their size
-    compare_directories(files[0], files[1], "size", diff)
+    compare_directories(files[0], files[1], "size", diff, merge, cache, plain)
 
 
 #
@@ -93,9 +137,12 @@ def size (
 def ctime (
     files: Optional[List[str]] = typer.Argument(None, help="The files to process"),
     diff:  bool = typer.Option(False, "--diff", "-d", help="Whether to show a diff command"),
+    merge: bool = typer.Option(False, "--merge", "-m", help="Whether to walk both trees together"),
+    cache: Optional[str] = typer.Option(None, "--cache", "-c", help="Cache file to skip listing unchanged directories on later runs"),
+    plain: bool = typer.Option(False, "--no-rich", help="Whether to print plain tab separated lines instead of a table"),
 ):
     # call the compare_directories function to compare the two directories based on their creation time
-    compare_directories(files[0], files[1], "ctime", diff)
+    compare_directories(files[0], files[1], "ctime", diff, merge, cache, plain)
 
 
 #
@@ -105,9 +152,12 @@ def ctime (
 def mtime (
     files: Optional[List[str]] = typer.Argument(None, help="The files to process"),
     diff:  bool = typer.Option(False, "--diff", "-d", help="Whether to show a diff command"),
+    merge: bool = typer.Option(False, "--merge", "-m", help="Whether to walk both trees together"),
+    cache: Optional[str] = typer.Option(None, "--cache", "-c", help="Cache file to skip listing unchanged directories on later runs"),
+    plain: bool = typer.Option(False, "--no-rich", help="Whether to print plain tab separated lines instead of a table"),
 ):
     # call the compare_directories function to compare the two directories based on their modification time
-    compare_directories(files[0], files[1], "mtime", diff)
+    compare_directories(files[0], files[1], "mtime", diff, merge, cache, plain)
 
 
 #
@@ -117,9 +167,12 @@ def mtime (
 def atime (
     files: Optional[List[str]] = typer.Argument(None, help="The files to process"),
     diff:  bool = typer.Option(False, "--diff", "-d", help="Whether to show a diff command"),
+    merge: bool = typer.Option(False, "--merge", "-m", help="Whether to walk both trees together"),
+    cache: Optional[str] = typer.Option(None, "--cache", "-c", help="Cache file to skip listing unchanged directories on later runs"),
+    plain: bool = typer.Option(False, "--no-rich", help="Whether to print plain tab separated lines instead of a table"),
 ):
     # call the compare_directories function to compare the two directories based on their last access time
-    compare_directories(files[0], files[1], "atime", diff)
+    compare_directories(files[0], files[1], "atime", diff, merge, cache, plain)
 
 #
 # Sync
@@ -155,8 +208,6 @@ def doc (
     """
     import importlib
     import importlib.util
-    import sys
-    import os
     import doc2md
 
     def import_path(path):
@@ -181,131 +232,422 @@ def doc (
 
 
 #
-# Count the number of files in a directory tree.
+# Scan a single directory
 #
-def count_files(directory):
-    count = 0
-    for entry in os.scandir(directory):
+# Returns the files found directly in current_path and the subdirectories
+# still to be scanned. Runs on a worker thread, so it only touches its own
+# dictionary; the caller merges the results.
+#
+# One copy of this function is generated per attribute at import time, with
+# the stat call and the value expression filled in, so the loop has no
+# per-file dispatch at all. Values are kept raw (bytes, whole seconds) and
+# only formatted for the rows that end up in the table, see formatters.
+#
+# entry.is_file() follows symlinks, so links to files are compared by their
+# target, like os.path.getsize; symlinked directories are not followed.
+#
+# Where scandir accepts a file descriptor, the directory is opened once and
+# every file is stat'ed relative to it (fstatat), so the kernel does not
+# resolve the full path again for each file.
+#
+scan_fd_template = """
+def scan_{attribute}(current_path, prefix_len):
+    files = {{}}
+    child_dirs = []
+    base = os.path.join(current_path, "")
+    sub_base = base[prefix_len:]
+    dir_fd = os.open(current_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        with os.scandir(dir_fd) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    st = {stat}
+                    files[sub_base + entry.name] = {value}
+                elif entry.is_dir(follow_symlinks=False):
+                    child_dirs.append(base + entry.name)
+    finally:
+        os.close(dir_fd)
+    return files, child_dirs
+"""
+
+scan_template = """
+def scan_{attribute}(current_path, prefix_len):
+    files = {{}}
+    child_dirs = []
+    for entry in os.scandir(current_path):
         if entry.is_file():
-            count += 1
-        elif entry.is_dir():
-            if not os.path.islink(entry.path):
-                count += count_files(entry.path)
-    return count
+            st = {stat}
+            files[entry.path[prefix_len:]] = {value}
+        elif entry.is_dir(follow_symlinks=False):
+            child_dirs.append(entry.path)
+    return files, child_dirs
+"""
 
 #
-# Compare two directories
+# Stat the files of a cached directory listing
 #
-# Not using a recursive function to parse the directories because we want to
-# display a progress bar while the directories are being parsed.
-#
-def parse_directory(path, files, attribute):
-    global total_files
-    expected_files = count_files(path)
-
-    with Progress() as progress:
-        task = progress.add_task(f"Parsing {path}", total=expected_files)
-        seen_files = 0
-        stack = [path]
-        while stack:
-            current_path = stack.pop()
-            for entry in os.scandir(current_path):
-                if entry.is_file():
-                    total_files += 1
-                    seen_files += 1
-                    progress.update(task, advance=1)
-                    file_path = os.path.join(entry.path)
-                    file_sub_path = remove_prefix(file_path, path)
-                    if attribute == "size":
-                        files[file_sub_path] = get_size(file_path)
-                    elif attribute == "ctime":
-                        files[file_sub_path] = convert_time(os.path.getctime(file_path))
-                    elif attribute == "mtime":
-                        files[file_sub_path] = convert_time(os.path.getmtime(file_path))
-                    elif attribute == "atime":
-                        files[file_sub_path] = convert_time(os.path.getatime(file_path))
-                elif entry.is_dir():
-                    if not os.path.islink(entry.path):
-                        stack.append(entry.path)
-
-
-def compare_directories(path1, path2, what="size", diff=False):
-    global total_files, differences
+# The counterpart of scan_<attribute> for directories whose listing is taken
+# from the cache: only the files named in the listing are stat'ed, so their
+# values are current. A name whose symlink target has gone is skipped, like
+# entry.is_file() would.
+#
+stat_fd_template = """
+def stat_{attribute}(current_path, prefix_len, names):
+    files = {{}}
+    sub_base = os.path.join(current_path, "")[prefix_len:]
+    dir_fd = os.open(current_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        for name in names:
+            try:
+                st = {stat}
+            except FileNotFoundError:
+                continue
+            files[sub_base + name] = {value}
+    finally:
+        os.close(dir_fd)
+    return files
+"""
 
-    print (f"Comparing {path1} and {path2} based on {what}")
+stat_template = """
+def stat_{attribute}(current_path, prefix_len, names):
+    files = {{}}
+    base = os.path.join(current_path, "")
+    sub_base = base[prefix_len:]
+    for name in names:
+        try:
+            st = {stat}
+        except FileNotFoundError:
+            continue
+        files[sub_base + name] = {value}
+    return files
+"""
 
-    files1 = {} # dictionary to hold the files in the first directory
-    files2 = {} # dictionary to hold the files in the second directory
-    time1  =  0 # variable to hold the time taken to parse the first directory
-    time2  =  0 # variable to hold the time taken to parse the second directory
-    count1 =  0 # variable to hold the number of files in the first directory
-    count2 =  0 # variable to hold the number of files in the second directory
+# whole seconds are taken from the integer fields, since the float st_*time
+# can round up to the next second
+value_expressions = {
+    "size":  "st.st_size",
+    "ctime": "st.st_ctime_ns // 10**9",
+    "mtime": "st.st_mtime_ns // 10**9",
+    "atime": "st.st_atime_ns // 10**9",
+}
 
-    time1  = timeit.timeit(lambda: parse_directory(path1, files1, what), number=1)
-    count1 = total_files
 
-    time2  = timeit.timeit(lambda: parse_directory(path2, files2, what), number=1)
-    count2 = total_files - count1
+def generate_scanners():
+    """
+    Helper function to generate the scan_<attribute> and stat_<attribute>
+    functions of every attribute
+
+    Returns two dictionaries mapping each attribute to its scanner and to its
+    stat function.
+    """
+    if os.scandir in os.supports_fd:
+        templates = (scan_fd_template, stat_fd_template)
+        paths     = ("entry.name", "name")
+        dir_fd    = ", dir_fd"
+    else:
+        templates = (scan_template, stat_template)
+        paths     = ("entry.path", "base + name")
+        dir_fd    = ""
+
+    generated = ({}, {})
+    for attribute in value_expressions:
+        # _statx.Statx has the same st_* fields as os.stat_result
+        if use_statx:
+            stats = [f"_statx.statx({path}, {_statx.MASKS[attribute]}{dir_fd})" for path in paths]
+        else:
+            # DirEntry.stat() is already relative to the directory fd, if any
+            stats = ["entry.stat()", f"os.stat({paths[1]}{dir_fd and ', dir_fd=dir_fd'})"]
+        value = value_expressions[attribute]
+        for kind, template, stat, functions in zip(("scan", "stat"), templates, stats, generated):
+            exec(template.format(attribute=attribute, stat=stat, value=value), globals())
+            functions[attribute] = globals()[f"{kind}_{attribute}"]
+    return generated
 
-    # create a table to hold the comparison results
-    table = rich.table.Table()
-    table.add_column("Location 1", justify="left") # column for the file path in the first directory
-    table.add_column("Location 2", justify="left") # column for the file path in the second directory
 
-    headers = {
-        "size": "Size",
-        "ctime": "Created",
-        "mtime": "Modified",
-        "atime": "Accessed"
-    }
+scanners, stat_functions = generate_scanners()
 
-    header = headers.get(what, "")
 
-    table.add_column(f"{header} 1", justify="right") # column for the attribute value in the first directory
-    table.add_column(f"{header} 2", justify="right") # column for the attribute value in the second directory
+def make_scanner(attribute, prefix_len, cache=None):
+    """
+    Helper function to pick the directory scanner for an attribute
+
+    Uses the compiled _walk module when it has been built, otherwise the
+    generated scan_<attribute> function. Either way the result takes a
+    directory path and returns (files, child_dirs).
+
+    cache, if given, is a tuple (known, seen, scan_start): directories in
+    known whose mtime is unchanged are not listed again, only their files are
+    stat'ed, and every scanned directory's listing is recorded in seen, see
+    _cache. Both are keyed by the directory path below the root; scan_start
+    is time.time_ns() at the start of the run.
+    """
+    if _walk is not None:
+        code = _walk.ATTRIBUTES[attribute]
+        scan = lambda current_path: _walk.scan_directory(current_path, prefix_len, code)
+    else:
+        scan_attribute = scanners[attribute]
+        scan = lambda current_path: scan_attribute(current_path, prefix_len)
+    if cache is None:
+        return scan
+
+    known, seen, scan_start = cache
+    stat_attribute = stat_functions[attribute]
+
+    def cached_scan(current_path):
+        # stat before scanning; a change during the scan leaves a recent
+        # mtime, which _cache.encode does not trust
+        mtime_ns = os.stat(current_path).st_mtime_ns
+        # the same key whether or not the root was given with a trailing slash
+        sub_path = current_path[prefix_len:].lstrip(os.sep)
+        entry = known.get(sub_path)
+        if entry is not None and entry[0] == mtime_ns:
+            seen[sub_path] = entry
+            names, dir_names = _cache.decode(entry)
+            return stat_attribute(current_path, prefix_len, names), [os.path.join(current_path, name) for name in dir_names]
+        sub_files, child_dirs = scan(current_path)
+        # file paths are the sub path of base plus the name
+        base_len = len(os.path.join(current_path, ""))
+        name_start = base_len - prefix_len
+        seen[sub_path] = _cache.encode(
+            mtime_ns,
+            [file_path[name_start:] for file_path in sub_files],
+            [child_dir[base_len:] for child_dir in child_dirs],
+            scan_start,
+        )
+        return sub_files, child_dirs
 
-    if diff:
-        table.add_column("Compare", justify="left")
+    return cached_scan
 
-    # Loop through files in Location 1
-    for file_path, attribute1 in files1.items():
-        if file_path in files2:
-            attribute2 = files2[file_path]
+
+#
+# Parse two directory trees
+#
+# Not using a recursive function to parse the directories because we want to
+# display a progress bar while the directories are being parsed. Each
+# directory is scanned on the given executor, since the work is dominated by
+# scandir/stat system calls which release the GIL, and both trees are walked
+# at the same time on that one pool.
+#
+# Yields (side, sub_files) for every scanned directory, side being 0 for
+# path1 and 1 for path2, in whatever order the scans finish. stats holds
+# [files, seconds] per tree and is updated as the walk goes.
+#
+def parse_directories(path1, path2, attribute, progress, executor, stats, caches=(None, None)):
+    start = time.perf_counter()
+    paths = (path1, path2)
+    # scandir builds every entry.path from path, so the prefix is a fixed slice
+    scans = [make_scanner(attribute, len(path), cache) for path, cache in zip(paths, caches)]
+    # the number of files is not known up front, so the bars are indeterminate
+    tasks = [progress.add_task(f"Parsing {path}", total=None) for path in paths]
+    reported = [0, 0]
+    outstanding = [1, 1]
+
+    pending = {executor.submit(scans[side], paths[side]): side for side in (0, 1)}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            side = pending.pop(future)
+            sub_files, child_dirs = future.result()
+            for child_dir in child_dirs:
+                pending[executor.submit(scans[side], child_dir)] = side
+            outstanding[side] += len(child_dirs) - 1
+
+            stats[side][0] += len(sub_files)
+            count = stats[side][0]
+            if outstanding[side] == 0:
+                stats[side][1] = time.perf_counter() - start
+                progress.update(tasks[side], total=count, completed=count)
+            # updating Rich costs more than a stat, so only every 256 files
+            elif count - reported[side] >= 256:
+                progress.update(tasks[side], completed=count)
+                reported[side] = count
+
+            yield side, sub_files
+
+
+#
+# Walk two directory trees together
+#
+# Scans corresponding directories of both trees side by side and yields
+# (file_path, attribute1, attribute2) for every file that differs, with None
+# for the side where it is missing. Only the directories still to be visited
+# are held in memory, instead of every file of both trees. stats holds
+# [files, seconds] per tree and is updated as the walk goes.
+#
+def merge_walk(path1, path2, attribute, stats, caches=(None, None)):
+    scans = (make_scanner(attribute, len(path1), caches[0]), make_scanner(attribute, len(path2), caches[1]))
+    roots = (path1, path2)
+    stack = [("", True, True)]
+    while stack:
+        sub_path, *present = stack.pop()
+        found = []
+        for side in (0, 1):
+            if present[side]:
+                start = time.perf_counter()
+                sub_files, child_dirs = scans[side](roots[side] + sub_path)
+                stats[side][1] += time.perf_counter() - start
+                stats[side][0] += len(sub_files)
+            else:
+                sub_files, child_dirs = {}, []
+            prefix_len = len(roots[side])
+            found.append((sub_files, {child_dir[prefix_len:] for child_dir in child_dirs}))
+
+        (files1, dirs1), (files2, dirs2) = found
+        for file_path in sorted(files1.keys() | files2.keys()):
+            attribute1 = files1.get(file_path)
+            attribute2 = files2.get(file_path)
             if attribute1 != attribute2:
-                differences += 1
-                # Add a row to the table for each different file
-                if diff:
-                    table.add_row(f"{path1}{file_path}", f"{path2}{file_path}", f"{attribute1}", f"{attribute2}", f"diff \"{path1}{file_path}\" \"{path2}{file_path}\"")
-                else:
-                    table.add_row(f"{path1}{file_path}", f"{path2}{file_path}", f"{attribute1}", f"{attribute2}")
-        else:
-            differences += 1
-            table.add_row(f"{path1}{file_path}", "MISSING", f"{attribute1}", "")
-
-    # Loop through files in Location 2 and check if they're missing in Location 1
-    for file_path in files2:
-        if file_path not in files1:
-            differences += 1
-            table.add_row("MISSING", f"{path2}{file_path}", "", files2[file_path])
-
-    # Add header to the table
-    if differences == 1:
-        table.title = f"[red]{differences}[/red] [green]Different File:[/green]"
+                yield file_path, attribute1, attribute2
+
+        for child_dir in sorted(dirs1 | dirs2, reverse=True):
+            stack.append((child_dir, child_dir in dirs1, child_dir in dirs2))
+
+
+#
+# Compare two directory trees while they are parsed
+#
+# Takes the (side, sub_files) batches of parse_directories and yields the
+# same (file_path, attribute1, attribute2) tuples as merge_walk. A file is
+# only held until its counterpart from the other tree shows up, so for
+# similar trees far fewer than all files are in memory at once; whatever is
+# left unmatched at the end is missing on the other side.
+#
+def diff_files(batches):
+    unmatched = ({}, {})
+
+    for side, sub_files in batches:
+        own   = unmatched[side]
+        other = unmatched[1 - side]
+        for file_path, attribute in sub_files.items():
+            if file_path in other:
+                other_attribute = other.pop(file_path)
+                if attribute != other_attribute:
+                    if side == 0:
+                        yield file_path, attribute, other_attribute
+                    else:
+                        yield file_path, other_attribute, attribute
+            else:
+                own[file_path] = attribute
+
+    for file_path, attribute1 in unmatched[0].items():
+        yield file_path, attribute1, None
+
+    for file_path, attribute2 in unmatched[1].items():
+        yield file_path, None, attribute2
+
+
+def compare_directories(path1, path2, what="size", diff=False, merge=False, cache=None, plain=False):
+    print (f"Comparing {path1} and {path2} based on {what}")
+
+    # (known, seen, scan_start) per tree, if a cache database is used
+    if cache:
+        scan_start = time.time_ns()
+        caches = tuple((_cache.load(cache, path), {}, scan_start) for path in (path1, path2))
     else:
-        table.title = f"[red]{differences}[/red] [green]Different Files:[/green]"
+        caches = (None, None)
+
+    # both trees are parsed at once, so the total is the elapsed time rather
+    # than the sum of the per-tree times
+    start = time.perf_counter()
+
+    if merge:
+        # walk both trees together, collecting the differences as we go
+        stats = [[0, 0.0], [0, 0.0]]
+        with Progress(refresh_per_second=4) as progress:
+            progress.add_task(f"Parsing {path1} and {path2}", total=None)
+            differing = list(merge_walk(path1, path2, what, stats, caches))
+        (count1, time1), (count2, time2) = stats
+    else:
+        # both trees are parsed at the same time on one pool of scan workers,
+        # and compared as their directories come in; stats holds the number
+        # of files and the time taken to parse each directory
+        stats = [[0, 0.0], [0, 0.0]]
+        with Progress(refresh_per_second=4) as progress, ThreadPoolExecutor(max_workers=scan_workers) as executor:
+            differing = list(diff_files(parse_directories(path1, path2, what, progress, executor, stats, caches)))
+        (count1, time1), (count2, time2) = stats
+
+    elapsed = time.perf_counter() - start
+
+    # the scans finish in any order; list the files by path
+    differing.sort(key=itemgetter(0))
 
-    # Get the number of rows in the terminal
-    rows, columns = os.popen('stty size', 'r').read().split()
+    if cache:
+        for path, (known, seen, scan_start) in zip((path1, path2), caches):
+            _cache.save(cache, path, seen)
+
+    differences = len(differing)
 
     # Display results
     if differences > 0:
-        if differences > int(rows)-5:
-            console = Console(file=StringIO())
-            console.print(table)
-            pydoc.pager(console.file.getvalue())
-            console.file.close()
+        fmt = formatters[what]
+
+        # format the differing files into plain rows first; only these rows
+        # are ever formatted
+        table_rows = []
+        for file_path, attribute1, attribute2 in differing:
+            if attribute2 is None:
+                table_rows.append((path1 + file_path, "MISSING", fmt(attribute1), ""))
+            elif attribute1 is None:
+                table_rows.append(("MISSING", path2 + file_path, "", fmt(attribute2)))
+            else:
+                # build each full path once and reuse it for the diff command
+                full1 = path1 + file_path
+                full2 = path2 + file_path
+                if diff:
+                    table_rows.append((full1, full2, fmt(attribute1), fmt(attribute2), f'diff "{full1}" "{full2}"'))
+                else:
+                    table_rows.append((full1, full2, fmt(attribute1), fmt(attribute2)))
+        del differing
+
+        # Get the number of rows in the terminal
+        columns, rows = shutil.get_terminal_size((80, 24))
+
+        if plain:
+            # tab separated lines, without the cost of laying out a Rich table
+            output = "\n".join("\t".join(row) for row in table_rows) + "\n"
+            if differences > rows-5:
+                pydoc.pager(output)
+            else:
+                sys.stdout.write(output)
         else:
-            rich.print(table)
+            # create a table to hold the comparison results
+            table = rich.table.Table()
+            table.add_column("Location 1", justify="left") # column for the file path in the first directory
+            table.add_column("Location 2", justify="left") # column for the file path in the second directory
+
+            headers = {
+                "size": "Size",
+                "ctime": "Created",
+                "mtime": "Modified",
+                "atime": "Accessed"
+            }
+
+            header = headers.get(what, "")
+
+            table.add_column(f"{header} 1", justify="right") # column for the attribute value in the first directory
+            table.add_column(f"{header} 2", justify="right") # column for the attribute value in the second directory
+
+            if diff:
+                table.add_column("Compare", justify="left")
+
+            # Add a row to the table for each different file
+            for row in table_rows:
+                table.add_row(*row)
+            del table_rows
+
+            # Add header to the table
+            if differences == 1:
+                table.title = f"[red]{differences}[/red] [green]Different File:[/green]"
+            else:
+                table.title = f"[red]{differences}[/red] [green]Different Files:[/green]"
+
+            if differences > rows-5:
+                console = Console(file=StringIO())
+                console.print(table)
+                pydoc.pager(console.file.getvalue())
+                console.file.close()
+            else:
+                rich.print(table)
 
     # Display statistics
     table_stats = rich.table.Table(show_header=False, show_edge=False, padding=0)
@@ -314,11 +656,36 @@ def compare_directories(path1, path2, what="size", diff=False):
     table_stats.add_column("Number of Files", justify="right")
     table_stats.add_row(f"Location 1: {path1}", "{:.6f} seconds".format(time1), "{} files".format(count1))
     table_stats.add_row(f"Location 2: {path2}", "{:.6f} seconds".format(time2), "{} files".format(count2))
-    table_stats.add_row(f"Total: ",       "{:.6f} seconds".format(time1+time2), "{} files".format(count2+count1))
+    table_stats.add_row(f"Total: ",       "{:.6f} seconds".format(elapsed), "{} files".format(count2+count1))
     rich.print(table_stats)
 
 
 
+#
+# Walk a directory tree for merging
+#
+# Yields (source_item, target_item, is_dir) for every entry below source,
+# each directory before its contents. Symlinked directories are reported as
+# directories but not descended into, like Path.rglob. Each directory is read
+# completely before anything is yielded, so its files can be moved away while
+# the walk goes on.
+#
+def walk_merge(source, target):
+    stack = [(source, target)]
+    while stack:
+        source_dir, target_dir = stack.pop()
+        with os.scandir(source_dir) as entries:
+            entries = list(entries)
+        for entry in entries:
+            target_item = os.path.join(target_dir, entry.name)
+            if entry.is_dir():
+                yield entry.path, target_item, True
+                if not entry.is_symlink():
+                    stack.append((entry.path, target_item))
+            else:
+                yield entry.path, target_item, False
+
+
 # 
 # Merge function
 #
@@ -339,83 +706,110 @@ def merge_directories(source, target, overwrite, delete, dry_run):
         else:
             target_path.mkdir(parents=True)
 
-    total_files = sum(1 for _ in source_path.rglob('*') if _.is_file())
+    # within one filesystem a file can simply be renamed into place
+    same_device = target_path.exists() and os.stat(source).st_dev == os.stat(target).st_dev
 
-    with Progress() as progress:
-        task = progress.add_task("Merging files...", total=total_files)
+    with Progress(refresh_per_second=4) as progress:
+        # the number of files is not known up front, so the bar is indeterminate
+        task = progress.add_task("Merging files...", total=None)
+        moved = 0
+        source_dirs = [] # every source directory, each after its parent
 
-        for item in source_path.rglob('*'):
-            relative_path = item.relative_to(source_path)
-            target_item = target_path / relative_path
-
-            if item.is_dir():
+        for item, target_item, is_dir in walk_merge(source, target):
+            if is_dir:
                 # Handle directory
-                if not target_item.exists():
+                source_dirs.append(item)
+                if not os.path.exists(target_item):
                     action_msg = f"create directory: {target_item}"
                     if dry_run:
                         with progress:
                             typer.echo(f"Dry run - would {action_msg}")
                     else:
-                        target_item.mkdir(parents=True, exist_ok=True)
+                        os.makedirs(target_item, exist_ok=True)
             else:
                 # Handle file
-                if not target_item.exists() or overwrite:
-                    action = "overwrite" if target_item.exists() else "move"
+                target_exists = os.path.exists(target_item)
+                if not target_exists or overwrite:
+                    action = "overwrite" if target_exists else "move"
                     action_msg = f"{action}: {item} to {target_item}"
                     if dry_run:
                         with progress:
                             print(f"Dry run - would {action_msg}")
+                    elif same_device:
+                        try:
+                            os.replace(item, target_item)
+                        except OSError:
+                            # e.g. a mount point below source, or a directory
+                            # in the way; shutil knows how to handle those
+                            shutil.move(item, target_item)
                     else:
-                        shutil.move(str(item), str(target_item))
+                        shutil.move(item, target_item)
                 elif dry_run:
                     with progress:
                         print(f"Dry run - would skip (already exists): {item} to {target_item}")
 
-                # Update progress for files only
-                progress.update(task, advance=1)
-                
+                # Update progress for files only, every 256 files
+                moved += 1
+                if moved % 256 == 0:
+                    progress.update(task, completed=moved)
+
+        progress.update(task, total=moved, completed=moved)
 
     if delete:
-        # Handle delete of empty subdirectories within the source
-        for sub_dir in sorted(source_path.rglob('*'), key=lambda x: -str(x.relative_to(source_path)).count(os.sep)):
-            if sub_dir.is_dir() and not any(sub_dir.iterdir()):
+        # Handle delete of empty subdirectories within the source; walking
+        # the list backwards visits every directory before its parent
+        for sub_dir in reversed(source_dirs):
+            if os.path.islink(sub_dir):
+                continue
+            with os.scandir(sub_dir) as entries:
+                empty = next(entries, None) is None
+            if empty:
                 if dry_run:
                     with progress:
                         print(f"Dry run - would delete empty directory: {sub_dir}")
                 else:
-                    sub_dir.rmdir()
+                    os.rmdir(sub_dir)
 
 
 
-def remove_prefix(text, prefix):
-    """
-    Helper function to remove the prefix of a string
-    """
-    if text.startswith(prefix):
-        return text[len(prefix):]
-    return text
-
-
+@lru_cache(maxsize=65536)
 def convert_time(time_stamp):
     """
     Helper function to convert a time stamp to a human-readable format
+
+    Time stamps are whole seconds and often shared by many files (e.g. build
+    output), so the formatted strings are cached.
     """
-    return datetime.fromtimestamp(time_stamp).strftime("%Y-%m-%d %H:%M:%S")
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time_stamp))
+
+
+#
+# Size units and their divisors, indexed by the power of 1024
+#
+size_units = (("bytes", 1), ("KB", 1024), ("MB", 1048576), ("GB", 1073741824))
 
 
-def get_size(path):
+def get_size(size):
     """
-    Helper function to get the size of a file
+    Helper function to format a file size in bytes
     """
-    size = os.path.getsize(path)
-    if size < 1024:
+    # every unit spans 10 bits; sizes beyond GB are still shown in GB
+    unit = min(max(size.bit_length() - 1, 0) // 10, 3)
+    if unit == 0:
         return f"{size} bytes"
-    elif size < pow(1024,2):
-        return f"{round(size/1024, 2)} KB"
-    elif size < pow(1024,3):
-        return f"{round(size/(pow(1024,2)), 2)} MB"
-    elif size < pow(1024,4):
-        return f"{round(size/(pow(1024,3)), 2)} GB"
+    name, divisor = size_units[unit]
+    return f"{round(size/divisor, 2)} {name}"
+
+
+#
+# Functions to format the compared value, per attribute
+#
+formatters = {
+    "size":  get_size,
+    "ctime": convert_time,
+    "mtime": convert_time,
+    "atime": convert_time,
+}
 
 
 #
@@ -423,7 +817,7 @@ def get_size(path):
 #
 if __name__ == "__main__":
     if sys.gettrace() is not None:
-       size(["a", "d"], False)
+       size(["a", "d"], False, merge=False, cache=None, plain=False)
     else:
         try:
             app()
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+"""
+Build the optional compiled directory scanner:
+
+$ python setup.py build_ext --inplace
+"""
+
+from setuptools import setup, Extension
+from Cython.Build import cythonize
+
+setup(
+    name="dircomp",
+    py_modules=["dircomp", "_statx", "_cache"],
+    ext_modules=cythonize([Extension("_walk", ["_walk.pyx"])]),
+)